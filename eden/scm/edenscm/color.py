@@ -251,6 +251,7 @@ def configstyles(ui) -> None:
                         % (e, status)
                     )
             ui._styles[status] = " ".join(good)
+    ui._stylecache.clear()
 
 
 def _activeeffects(ui):
@@ -339,7 +340,12 @@ def colorlabel(ui, msg, label, usebytes: bool = False) -> Union[bytes, str]:
             if not ui._styler:
                 ui._styler = bindings.io.styler(supportedcolors(ui))
 
-            style = " ".join(ui._styles.get(l, l) for l in label.split())
+            # The split-and-join over _styles is per-label constant; cache it
+            # so repeated labels (bookmarks, status columns, ...) parse once.
+            style = ui._stylecache.get(label)
+            if style is None:
+                style = " ".join(ui._styles.get(l, l) for l in label.split())
+                ui._stylecache[label] = style
             if not usebytes:
                 # Roundtrip strings to clear out non-utf8 characters.
                 msg = encodeutf8(msg, errors="backslashreplace")
@@ -146,9 +146,14 @@ coreconfigitem("bundle", "mainreporoot", default="")
 coreconfigitem("bundle2", "rechunkthreshold", default="1MB")
 # bundle.reorder: experimental config
 coreconfigitem("bundle", "reorder", default="auto")
+coreconfigitem("cache", "repo-state-ttl-ms", default=100)
 coreconfigitem("censor", "policy", default="abort")
 coreconfigitem("chgserver", "idletimeout", default=3600)
 coreconfigitem("chgserver", "skiphash", default=False)
+coreconfigitem("clone", "copy-workers", default=4)
+coreconfigitem("clone", "local-cache", default=False)
+coreconfigitem("clone", "local-cache-path", default=None)
+coreconfigitem("clone", "parallel-peer-setup", default=False)
 coreconfigitem("clone", "prefer-edenapi-clonedata", default=True)
 coreconfigitem("clone", "nativepull", default=False)
 coreconfigitem("cmdserver", "log", default=None)
@@ -0,0 +1,1564 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This software may be used and distributed according to the terms of the
+# GNU General Public License version 2.
+
+# hg.py - repository classes for mercurial
+#
+# Copyright 2005-2007 Olivia Mackall <olivia@selenic.com>
+# Copyright 2006 Vadim Gelfer <vadim.gelfer@gmail.com>
+#
+# This software may be used and distributed according to the terms of the
+# GNU General Public License version 2 or any later version.
+
+from __future__ import absolute_import
+
+import contextlib
+import copy
+import errno
+import hashlib
+import operator
+import os
+import shutil
+import threading
+import time
+from typing import Iterable, Optional, Union
+
+import bindings
+
+# Modules that are only needed for specific operations (merge/update,
+# pull/push exchange, the clone fast paths, eden status output) are imported
+# where they are used, keeping plain `import edenscm.hg` cheap for callers
+# that bypass the dispatch-time demandimporter.
+from . import (
+    bookmarks,
+    eagerpeer,
+    error,
+    extensions,
+    localrepo,
+    lock,
+    mononokepeer,
+    node,
+    perftrace,
+    phases,
+    progress,
+    pycompat,
+    sshpeer,
+    ui as uimod,
+    url,
+    util,
+    vfs as vfsmod,
+)
+from .i18n import _
+
+
+release = lock.release
+
+# shared features
+sharedbookmarks = "bookmarks"
+
+
+# URL parsing is pure Python string work and the clone/share path parses the
+# same few strings many times over. Cache parsed util.url objects, handing out
+# shallow copies since some callers mutate them (e.g. parseurl clears the
+# fragment).
+_urlcache = {}
+_urlcachemaxsize = 256
+
+
+def _cachedurl(path, parsequery=True, parsefragment=True):
+    key = (path, parsequery, parsefragment)
+    u = _urlcache.get(key)
+    if u is None:
+        if len(_urlcache) >= _urlcachemaxsize:
+            _urlcache.clear()
+        u = util.url(path, parsequery=parsequery, parsefragment=parsefragment)
+        _urlcache[key] = u
+    return copy.copy(u)
+
+
+def _local(path):
+    from . import bundlerepo
+
+    path = util.expandpath(util.urllocalpath(path))
+    return os.path.isfile(path) and bundlerepo or localrepo
+
+
+def _bundle(path):
+    """return the bundlerepo module, imported on first use
+
+    Takes the place of the module itself in the schemes table so that
+    importing hg.py does not pull in the bundle machinery; _peerlookup
+    callers only need the returned module's instance/islocal attributes.
+    """
+    from . import bundlerepo
+
+    return bundlerepo
+
+
+def addbranchrevs(lrepo, other, branches, revs):
+    hashbranch, branches = branches
+    if not hashbranch and not branches:
+        # the common case; answered without materializing a peer, which can
+        # involve a handshake for remote repos
+        x = revs or None
+        if revs is None:
+            y = None
+        elif hasattr(type(revs), "first"):
+            # smartset-like; class-level probe avoids safehasattr's
+            # try/except on plain lists
+            y = revs.first()
+        elif revs:
+            y = revs[0]
+        else:
+            y = None
+        return x, y
+    peer = other.peer()  # a courtesy to callers using a localrepo for other
+    if revs:
+        revs = list(revs)
+    else:
+        revs = []
+
+    if not peer.capable("branchmap"):
+        if branches:
+            raise error.Abort(_("remote branch lookup not supported"))
+        revs.append(hashbranch)
+        return revs, revs[0]
+    branchmap = peer.branchmap()
+    # hex-encode each branch once up front; primary() may consult the same
+    # branch several times (explicit branches plus hashbranch)
+    hexmap = {b: [node.hex(r) for r in reversed(v)] for b, v in branchmap.items()}
+
+    def primary(branch):
+        if branch == ".":
+            if not lrepo:
+                raise error.Abort(_("dirstate branch not accessible"))
+            branch = lrepo.dirstate.branch()
+        hexrevs = hexmap.get(branch)
+        if hexrevs is not None:
+            revs.extend(hexrevs)
+            return True
+        else:
+            return False
+
+    for branch in branches:
+        if not primary(branch):
+            raise error.RepoLookupError(_("unknown branch '%s'") % branch)
+    if hashbranch:
+        if not primary(hashbranch):
+            revs.append(hashbranch)
+    return revs, revs[0]
+
+
+def parseurl(path, branches=None):
+    """parse url#branch, returning (url, (branch, branches))"""
+
+    u = _cachedurl(path)
+    branch = None
+    if u.fragment:
+        branch = u.fragment
+        u.fragment = None
+    return str(u), (branch, branches or [])
+
+
+schemes = {
+    "bundle": _bundle,
+    "eager": eagerpeer,
+    "file": _local,
+    "mononoke": mononokepeer,
+    "ssh": sshpeer,
+    "test": eagerpeer,
+}
+
+# prebound method, one dict lookup per call in _peerlookup; the dict itself
+# stays mutable for extensions
+_schemes_get = schemes.get
+
+
+def _fastscheme(path):
+    """cheaply extract the scheme from a URL for the common cases, or None
+
+    Avoids a full util.url parse when the path starts with an unambiguous
+    "scheme://" prefix. Callers fall back to util.url when this returns None.
+    """
+    i = path.find("://")
+    if 0 < i < 12:
+        scheme = path[:i]
+        if scheme.isalpha():
+            return scheme
+    return None
+
+
+# scheme -> (handler, has "instance" attribute); the attribute probe involves
+# exception handling for lazy modules, so run it once per scheme rather than
+# once per lookup. Keyed on the handler identity too, since extensions mutate
+# the schemes table (e.g. ext/schemes.py).
+_peerdispatchcache = {}
+
+
+def _peerlookup(path):
+    scheme = _fastscheme(path)
+    if scheme is None:
+        u = _cachedurl(path)
+        scheme = u.scheme or "file"
+    thing = _schemes_get(scheme) or schemes["file"]
+    cached = _peerdispatchcache.get(scheme)
+    if cached is not None and cached[0] is thing:
+        hasinstance = cached[1]
+    else:
+        # we can't test callable(thing) because 'thing' can be an unloaded
+        # module that implements __call__
+        hasinstance = util.safehasattr(thing, "instance")
+        _peerdispatchcache[scheme] = (thing, hasinstance)
+    try:
+        return thing(path)
+    except TypeError:
+        if not hasinstance:
+            raise
+        return thing
+
+
+# clone() asks islocal about the same source/dest strings several times;
+# cleared at the end of each clone since the answer involves the filesystem
+_islocalcache = {}
+
+
+def islocal(repo: str):
+    """return true if repo (or path pointing to repo) is local"""
+    if isinstance(repo, str):
+        v = _islocalcache.get(repo)
+        if v is None:
+            try:
+                v = _peerlookup(repo).islocal(repo)
+            except AttributeError:
+                v = False
+            if len(_islocalcache) >= 32:
+                _islocalcache.clear()
+            _islocalcache[repo] = v
+        return v
+    return repo.local()
+
+
+def openpath(ui, path):
+    """open path with open if local, url.open if remote"""
+    pathurl = _cachedurl(path, parsequery=False, parsefragment=False)
+    if pathurl.islocal():
+        return util.posixfile(pathurl.localpath(), "rb")
+    else:
+        return url.open(ui, path)
+
+
+# a list of (ui, repo) functions called for wire peer initialization
+wirepeersetupfuncs = []
+
+
+# Cache of reposetup hooks so repo construction does not re-probe every
+# loaded extension module; a single clone builds several peers in a row.
+# Keyed by the enabled (name, module) pairs, which also invalidates the
+# entry when extensions are (re)loaded.
+_reposetupcache = {}
+
+
+def _reposetuphooks(ui):
+    """return the (cached) list of extension reposetup hooks for ui"""
+    exts = tuple(extensions.extensions(ui))
+    hooks = _reposetupcache.get(exts)
+    if hooks is None:
+        hooks = _reposetupcache[exts] = [
+            module.reposetup
+            for name, module in exts
+            if getattr(module, "reposetup", None)
+        ]
+    return hooks
+
+
+def _setuprepo(ui, repo, presetupfuncs=None) -> None:
+    ui = getattr(repo, "ui", ui)
+    for f in presetupfuncs or []:
+        f(ui, repo)
+    for hook in _reposetuphooks(ui):
+        hook(ui, repo)
+    if not repo.local():
+        perftrace.traceflag("remote")
+        for f in wirepeersetupfuncs:
+            f(ui, repo)
+    else:
+        perftrace.traceflag("local")
+
+
+@perftrace.tracefunc("Repo Setup")
+def repository(
+    ui, path: str = "", create: bool = False, presetupfuncs=None, initial_config=None
+):
+    """return a repository object for the specified path"""
+    if not create and isinstance(path, localrepo.localrepository):
+        # the caller already holds an opened local repository; reposetup
+        # hooks ran when it was constructed, so skip URL parsing and module
+        # dispatch entirely
+        return path
+    u = _cachedurl(path)
+    if u.scheme == "bundle":
+        creator = _bundle(path)
+    else:
+        creator = _local(path)
+
+    repo = creator.instance(ui, path, create, initial_config)
+    _setuprepo(ui, repo, presetupfuncs=presetupfuncs)
+    repo = repo.local()
+    if not repo:
+        raise error.Abort(_("repository '%s' is not local") % path)
+    return repo
+
+
+@perftrace.tracefunc("Peer Setup")
+def peer(uiorrepo, opts, path, create: bool = False):
+    """return a repository peer for the specified path"""
+    if not create and isinstance(path, localrepo.localrepository):
+        # already-constructed repository object; see repository() above
+        return path.peer()
+    rui = remoteui(uiorrepo, opts)
+    obj = _peerlookup(path).instance(rui, path, create, initial_config=None)
+    # Uncomment this once we stop using file clones in sandcastle
+    # if obj.local() and not rui.configbool("experimental", "allowfilepeer"):
+    #    raise error.Abort(_("cannot create peer for local file repository '%s'")
+    #        % path)
+    _setuprepo(rui, obj)
+    return obj.peer()
+
+
+def defaultdest(source):
+    """return default destination of clone if none is given
+
+    >>> defaultdest('foo')
+    'foo'
+    >>> defaultdest('/foo/bar')
+    'bar'
+    >>> defaultdest('/')
+    ''
+    >>> defaultdest('')
+    ''
+    >>> defaultdest('http://example.org/')
+    ''
+    >>> defaultdest('http://example.org/foo/')
+    'foo'
+    """
+    path = _cachedurl(source).path
+    if not path:
+        return ""
+    return os.path.basename(os.path.normpath(path))
+
+
+def share(
+    ui,
+    source: str,
+    dest=None,
+    update: bool = True,
+    bookmarks: bool = True,
+    defaultpath=None,
+    relative: bool = False,
+):
+    """create a shared repository"""
+
+    if not islocal(source):
+        raise error.Abort(_("can only share local repositories"))
+
+    if not dest:
+        dest = defaultdest(source)
+    else:
+        dest = ui.expandpath(dest)
+
+    if isinstance(source, str):
+        origsource = ui.expandpath(source)
+        source, branches = parseurl(origsource)
+        srcrepo = repository(ui, source)
+        rev, checkout = addbranchrevs(srcrepo, srcrepo, branches, None)
+    else:
+        srcrepo = source.local()
+        origsource = source = srcrepo.url()
+        checkout = None
+
+    sharedpath = srcrepo.sharedpath  # if our source is already sharing
+
+    destwvfs = vfsmod.vfs(dest, realpath=True)
+    destvfs = vfsmod.vfs(
+        os.path.join(destwvfs.base, ui.identity.dotdir()), realpath=True
+    )
+
+    if destvfs.lexists():
+        raise error.Abort(_("destination already exists"))
+
+    if not destwvfs.isdir():
+        destwvfs.mkdir()
+    destvfs.makedir()
+
+    requirements = srcrepo.requirements.copy()
+
+    if relative:
+        try:
+            sharedpath = os.path.relpath(sharedpath, destvfs.base)
+            requirements.add("relshared")
+        except (IOError, ValueError) as e:
+            # ValueError is raised on Windows if the drive letters differ on
+            # each path
+            raise error.Abort(_("cannot calculate relative path"), hint=str(e))
+    else:
+        requirements.add("shared")
+
+    # same serialization as scmutil.writerequires, but batched with the
+    # sharedpath write so the new repo skeleton costs one metadata flush
+    requirestext = "".join("%s\n" % r for r in sorted(requirements))
+    destvfs.batchwrite(
+        [
+            ("requires", pycompat.encodeutf8(requirestext)),
+            ("sharedpath", pycompat.encodeutf8(sharedpath)),
+        ]
+    )
+
+    r = repository(ui, destwvfs.base)
+    postshare(srcrepo, r, bookmarks=bookmarks, defaultpath=defaultpath)
+    _postshareupdate(r, update, checkout=checkout)
+    return r
+
+
+def unshare(ui, repo) -> None:
+    """convert a shared repository to a normal one
+
+    Copy the store data to the repo and remove the sharedpath data.
+    """
+
+    destlock = lock = None
+    lock = repo.lock()
+    try:
+        # we use locks here because if we race with commit, we
+        # can end up with extra data in the cloned revlogs that's
+        # not pointed to by changesets, thus causing verify to
+        # fail
+
+        destlock = copystore(ui, repo, repo.path)
+
+        sharefile = repo.localvfs.join("sharedpath")
+        util.rename(sharefile, sharefile + ".old")
+
+        repo.requirements.discard("shared")
+        repo.requirements.discard("relshared")
+        repo._writerequirements()
+    finally:
+        destlock and destlock.release()
+        lock and lock.release()
+
+    # update store, spath, svfs and sjoin of repo
+    # invalidate before rerunning __init__
+    repo.invalidate(clearfilecache=True)
+    repo.invalidatedirstate()
+    repo.__init__(repo.baseui, repo.root)
+
+
+def postshare(sourcerepo, destrepo, bookmarks: bool = True, defaultpath=None) -> None:
+    """Called after a new shared repo is created.
+
+    The new repo only has a requirements file and pointer to the source.
+    This function configures additional shared data.
+
+    Extensions can wrap this function and write additional entries to
+    destrepo/.hg/shared to indicate additional pieces of data to be shared.
+    """
+    default = defaultpath or sourcerepo.ui.config("paths", "default")
+    with destrepo.wlock():
+        files = []
+        if default:
+            files.append(
+                (
+                    destrepo.ui.identity.configrepofile(),
+                    pycompat.encodeutf8(
+                        util.tonativeeol("[paths]\ndefault = %s\n" % default)
+                    ),
+                )
+            )
+        if bookmarks:
+            files.append(("shared", pycompat.encodeutf8(sharedbookmarks + "\n")))
+        if files:
+            destrepo.localvfs.batchwrite(files)
+
+
+def _firstlookup(repo, names):
+    """resolve the first name in names that exists in repo, or None
+
+    Checks the bookmark table directly before falling back to a full
+    lookup, so misses on plain bookmark names do not pay for a raised
+    RepoLookupError.
+    """
+    bm = repo._bookmarks
+    for name in names:
+        if name is None:
+            continue
+        n = bm.get(name)
+        if n is not None:
+            return n
+        try:
+            return repo.lookup(name)
+        except error.RepoLookupError:
+            continue
+    return None
+
+
+def _postshareupdate(repo, update, checkout=None) -> None:
+    """Maybe perform a working directory update after a shared repo is created.
+
+    ``update`` can be a boolean or a revision to update to.
+    """
+    if not update:
+        return
+
+    repo.ui.status(_("updating working directory\n"))
+    if update is not True:
+        checkout = update
+    uprev = _firstlookup(repo, (checkout, "default", "tip"))
+    _update(repo, uprev)
+
+
+def copystore(ui, srcrepo, destpath) -> None:
+    """copy files from store of srcrepo in destpath
+
+    returns destlock
+    """
+    destlock = None
+    try:
+        with progress.bar(ui, _("linking")) as prog:
+            # None lets util.copyfiles auto-detect hardlink support against
+            # the destination device
+            hardlink = None
+            num = 0
+            srcpublishing = srcrepo.publishing()
+            srcvfs = vfsmod.vfs(srcrepo.sharedpath)
+            dstvfs = vfsmod.vfs(destpath)
+            # First pass: filter the copy list, create target directories and
+            # take the target lock, collecting (src, dst) pairs so the copies
+            # themselves can be issued as one batch below. copylist entries
+            # are already normalized relative paths, so build the full paths
+            # by concatenation instead of re-normalizing through vfs.join for
+            # every file.
+            srcprefix = srcvfs.base + pycompat.ossep
+            dstprefix = dstvfs.base + pycompat.ossep
+            copies = []
+            # most entries share the same parent (e.g. data/); remember what
+            # was already created instead of a stat per file
+            madedirs = set()
+            for f in srcrepo.store.copylist():
+                if srcpublishing and f.endswith("phaseroots"):
+                    continue
+                dstbase = os.path.dirname(f)
+                if dstbase and dstbase not in madedirs:
+                    madedirs.add(dstbase)
+                    if not os.path.exists(dstprefix + dstbase):
+                        dstvfs.mkdir(dstbase)
+                if os.path.exists(srcprefix + f):
+                    if f.endswith("data"):
+                        # 'dstbase' may be empty (e.g. revlog format 0)
+                        lockfile = os.path.join(dstbase, "lock")
+                        # lock to avoid premature writing to the target
+                        destlock = lock.lock(dstvfs, lockfile, ui=ui)
+                    copies.append((srcprefix + f, dstprefix + f))
+            # Second pass: issue the batched copies. The entries are
+            # independent of each other once the directories and lock exist,
+            # and link/copy release the GIL, so fan them out across a small
+            # thread pool.
+            workers = ui.configint("clone", "copy-workers")
+            if workers > 1 and len(copies) > 1:
+                from concurrent.futures import ThreadPoolExecutor, as_completed
+
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    # submit None rather than the running value so every
+                    # worker auto-detects independently; the aggregate only
+                    # feeds the debug message below
+                    futures = [
+                        pool.submit(util.copyfiles, srcpath, dstpath, None)
+                        for srcpath, dstpath in copies
+                    ]
+                    for future in as_completed(futures):
+                        linked, n = future.result()
+                        hardlink = hardlink or linked
+                        num += n
+                        prog.value = num
+            else:
+                for srcpath, dstpath in copies:
+                    hardlink, num = util.copyfiles(
+                        srcpath, dstpath, hardlink, num, prog
+                    )
+        if hardlink:
+            ui.debug("linked %d files\n" % num)
+        else:
+            ui.debug("copied %d files\n" % num)
+        # pyre-fixme[7]: Expected `None` but got `Optional[pythonlock]`.
+        return destlock
+    except:  # re-raises
+        release(destlock)
+        raise
+
+
+def _batchlookup(peer, keys):
+    """resolve keys to nodes, batching the lookups into one request
+
+    A lookup on a remote peer is a network round-trip; use the peer's
+    command batching so N keys cost one round-trip instead of N. Peers
+    without batching support fall back to sequential lookups.
+    """
+    keys = list(keys)
+    if len(keys) > 1 and util.safehasattr(peer, "iterbatch"):
+        batch = peer.iterbatch()
+        for key in keys:
+            batch.lookup(key)
+        batch.submit()
+        return list(batch.results())
+    return [peer.lookup(key) for key in keys]
+
+
+@contextlib.contextmanager
+def _backgroundcleanup(atexit_rmtree, cleanup_path):
+    """remove cleanup_path in the background if the wrapped block fails
+
+    A partially populated clone can take a long time to unlink. Rename it
+    aside so the destination path is freed immediately and the error
+    reaches the user without waiting, then finish the removal on a
+    non-daemon thread (interpreter shutdown waits for it). If the rename
+    fails, fall back to the queued atexit removal.
+
+    Yields a cancel callable that disarms both the atexit guard and the
+    background removal. Once the clone data is fully transferred the
+    caller cancels, and later failures (a bad update rev, a hook abort)
+    must leave the completed clone on disk.
+    """
+    armed = [True]
+
+    def cancel():
+        armed[0] = False
+        atexit_rmtree.cancel()
+
+    try:
+        yield cancel
+    except Exception:
+        if not armed[0]:
+            raise
+        deletepath = "%s-deleting-%d" % (cleanup_path, os.getpid())
+        try:
+            os.rename(cleanup_path, deletepath)
+        except OSError:
+            deletepath = None
+        if deletepath is not None:
+            atexit_rmtree.cancel()
+            threading.Thread(
+                target=shutil.rmtree,
+                args=(deletepath,),
+                kwargs={"ignore_errors": True},
+                name="clone-cleanup",
+            ).start()
+        raise
+
+
+def _clonecachepath(ui, source) -> str:
+    """return the bare-clone cache directory for the given source URL"""
+    root = ui.config("clone", "local-cache-path") or os.path.join(
+        util.expandpath("~"), ".cache", ui.identity.cliname(), "clones"
+    )
+    return os.path.join(root, hashlib.sha256(source.encode("utf-8")).hexdigest())
+
+
+def _clonecachepeer(ui, peeropts, source, srcpeer):
+    """populate or refresh the local clone cache for source
+
+    Returns a peer for the cached bare clone, or None if the cache could
+    not be used. The cache lets repeated clones of the same source pay
+    only an incremental pull plus a local store copy.
+    """
+    from . import exchange
+
+    path = _clonecachepath(ui, source)
+    try:
+        util.makedirs(path)
+        cachevfs = vfsmod.vfs(path)
+        with lock.lock(cachevfs, "clone-cache.lock", timeout=600, ui=ui):
+            if os.path.exists(os.path.join(path, ui.identity.dotdir())):
+                cacherepo = repository(ui, path)
+            else:
+                cacherepo = repository(ui, path, create=True)
+            with cacherepo.wlock(), cacherepo.lock(), cacherepo.transaction(
+                "clonecache"
+            ):
+                exchange.pull(cacherepo, srcpeer)
+        return peer(ui, peeropts, path)
+    except Exception as e:
+        ui.warn(_("warning: not using clone cache (%s)\n") % e)
+        return None
+
+
+def clone(
+    ui,
+    peeropts,
+    source,
+    dest=None,
+    pull: bool = False,
+    rev=None,
+    update: Union[bool, str] = True,
+    stream: Optional[bool] = False,
+    shallow: bool = False,
+):
+    """Make a copy of an existing repository.
+
+    Create a copy of an existing repository in a new directory.  The
+    source and destination are URLs, as passed to the repository
+    function.  Returns a pair of repository peers, the source and
+    newly created destination.
+
+    The location of the source is added to the new repository's
+    .hg/hgrc file, as the default to be used for future pulls and
+    pushes.
+
+    If an exception is raised, the partly cloned/updated destination
+    repository will be deleted.
+
+    Arguments:
+
+    source: repository object or URL
+
+    dest: URL of destination repository to create (defaults to base
+    name of source repository)
+
+    pull: always pull from source repository, even in local case or if the
+    server prefers streaming
+
+    stream: stream raw data uncompressed from repository (fast over
+    LAN, slow over WAN)
+
+    rev: revision to clone up to (implies pull=True)
+
+    update: update working directory after clone completes, if
+    destination is local repository (True means update to default rev,
+    anything else is treated as a revision)
+    """
+    from . import clone as clonemod, exchange
+
+    ui.log(
+        "clone_info",
+        rust_clone=False,
+        clone_type="full",
+        is_update_clone=update,
+    )
+
+    # A clone constructs several peers/repos in a row; warm the reposetup
+    # hook cache once up front so each construction reuses it.
+    _reposetuphooks(ui)
+
+    if dest is None:
+        dest = defaultdest(source)
+        if dest:
+            ui.status(_("destination directory: %s\n") % dest)
+    else:
+        dest = ui.expandpath(dest)
+
+    destpeer = None
+    dest = util.urllocalpath(dest)
+    if not dest:
+        raise error.Abort(_("empty destination path is not valid"))
+
+    cleanup_path = dest
+    destvfs = vfsmod.vfs(dest, expandpath=True)
+    if destvfs.lexists():
+        if not destvfs.isdir():
+            raise error.Abort(_("destination '%s' already exists") % dest)
+        elif destvfs.listdir():
+            raise error.Abort(_("destination '%s' is not empty") % dest)
+        cleanup_path = os.path.join(dest, ui.identity.dotdir())
+
+    with bindings.atexit.AtExit.rmtree(
+        cleanup_path
+    ) as atexit_rmtree, _backgroundcleanup(
+        atexit_rmtree, cleanup_path
+    ) as cancelcleanup:
+        # Create the destination repo before we even open the connection to the
+        # source, so we can use any repo-specific configuration for the connection.
+        try:
+            # Note: This triggers hgrc.dynamic generation with empty repo hgrc.
+            destpeer = repository(ui, dest, create=True)
+        except OSError as inst:
+            if inst.errno == errno.EEXIST:
+                raise error.Abort(_("destination '%s' already exists") % dest)
+            raise
+
+        destrepo = destpeer.local()
+
+        # Get the source url, so we can write it into the dest hgrc
+        if isinstance(source, str):
+            origsource = ui.expandpath(source)
+        else:
+            srcpeer = source.peer()  # in case we were called with a localrepo
+            origsource = source = source.peer().url()
+
+        abspath = origsource
+        if islocal(origsource):
+            abspath = os.path.abspath(util.urllocalpath(origsource))
+
+        srcpeerfuture = None
+        if isinstance(source, str) and ui.configbool("clone", "parallel-peer-setup"):
+            # Overlap the source peer handshake with the destination setup
+            # below. The peer is built against the global ui rather than
+            # destrepo.ui, so repo-level configs from the fresh hgrc are not
+            # applied to it; that is why this is opt-in.
+            from concurrent.futures import ThreadPoolExecutor
+
+            pool = ThreadPoolExecutor(max_workers=1)
+            srcpeerfuture = pool.submit(peer, ui, peeropts, parseurl(origsource)[0])
+            pool.shutdown(wait=False)
+
+        try:
+            if destrepo:
+                _writehgrc(destrepo, abspath, ui.configlist("_configs", "configfiles"))
+                # Reload hgrc to pick up `%include` configs. We don't need to
+                # regenerate dynamicconfig here, unless the hgrc contains reponame or
+                # username overrides (unlikely).
+                destrepo.ui.reloadconfigs(destrepo.root)
+
+                if shallow:
+                    from edenscm.ext.remotefilelog.shallowrepo import requirement
+
+                    if requirement not in destrepo.requirements:
+                        with destrepo.lock():
+                            destrepo.requirements.add(requirement)
+                            destrepo._writerequirements()
+                        # Reopen the repo so reposetup in extensions can see the added
+                        # requirement.
+                        # To keep command line config overrides, reuse the ui from the
+                        # old repo object. A cleaner way might be figuring out the
+                        # overrides and then set them, in case extensions changes the
+                        # class of the ui object.
+                        origui = destrepo.ui
+                        destrepo = repository(ui, dest)
+                        destrepo.ui = origui
+        except Exception:
+            # The speculative peer may already hold an open connection; wait
+            # for it and close it so aborting here does not leak the child
+            # process.
+            if srcpeerfuture is not None:
+                try:
+                    srcpeerfuture.result().close()
+                except Exception:
+                    pass
+            raise
+
+        # Construct the srcpeer after the destpeer, so we can use the destrepo.ui
+        # configs.
+        if isinstance(source, str):
+            source, mayberevs = parseurl(origsource)
+            if len(mayberevs) == 1:
+                rev = rev or mayberevs[0]
+            if srcpeerfuture is not None:
+                srcpeer = srcpeerfuture.result()
+            else:
+                srcpeer = peer(destrepo.ui if destrepo else ui, peeropts, source)
+
+        branch = (None, [])
+        # pyre-fixme[61]: `srcpeer` is undefined, or not always defined.
+        rev, checkout = addbranchrevs(srcpeer, srcpeer, branch, rev)
+
+        source = util.urllocalpath(source)
+
+        srclock = destlock = destlockw = None
+        srcrepo = srcpeer.local()
+
+        # Optionally maintain a local bare-clone cache so repeated clones of
+        # the same remote source only pay an incremental pull plus a local
+        # store copy.
+        cachepeer = None
+        if (
+            srcrepo is None
+            and not rev
+            and not pull
+            and islocal(dest)
+            and ui.configbool("clone", "local-cache")
+        ):
+            cachepeer = _clonecachepeer(ui, peeropts, source, srcpeer)
+            if cachepeer is not None:
+                # The cache only serves as the source of the store copy;
+                # srcpeer stays pointed at the real remote so post-clone
+                # processing (update rev lookup, clonepreclose extensions
+                # like remotenames) sees the configured source rather than
+                # the cache directory.
+                srcrepo = cachepeer.local()
+        try:
+            copy = False
+            if (
+                srcrepo
+                and srcrepo.cancopy()
+                and islocal(dest)
+                and not phases.hassecret(srcrepo)
+            ):
+                copy = not pull and not rev
+
+            if copy:
+                try:
+                    # we use a lock here because if we race with commit, we
+                    # can end up with extra data in the cloned revlogs that's
+                    # not pointed to by changesets, thus causing verify to
+                    # fail
+                    srclock = srcrepo.lock(wait=False)
+                except error.LockError:
+                    copy = False
+
+            if copy:
+                clonecodepath = "copy"
+
+                srcrepo.hook("preoutgoing", throw=True, source="clone")
+                hgdir = os.path.realpath(os.path.join(dest, ui.identity.dotdir()))
+                if not os.path.exists(dest):
+                    os.mkdir(dest)
+                destpath = hgdir
+
+                # Drop the existing destrepo so Windows releases the files.
+                destpeer = destrepo = None
+                if pycompat.iswindows:
+                    # Manually gc to ensure the objects are dropped. Only
+                    # Windows needs the handles released eagerly; elsewhere
+                    # a full collection is just a stop-the-world pause.
+                    import gc
+
+                    gc.collect()
+
+                destlock = copystore(ui, srcrepo, destpath)
+                # repo initialization might also take a lock. Keeping destlock
+                # outside the repo object can cause deadlock. To avoid deadlock,
+                # we just release destlock here. The lock will be re-acquired
+                # soon by `destpeer`, or `local.lock()` below.
+                if destlock is not None:
+                    destlock.release()
+
+                # copy bookmarks over
+                srcbookmarks = srcrepo.svfs.join("bookmarks")
+                dstbookmarks = os.path.join(destpath, "store", "bookmarks")
+                if os.path.exists(srcbookmarks):
+                    util.copyfile(srcbookmarks, dstbookmarks)
+
+                # we need to re-init the repo after manually copying the data
+                # into it
+                destpeer = peer(srcrepo, peeropts, dest)
+                destrepo = destpeer.local()
+                srcrepo.hook("outgoing", source="clone", node=node.hex(node.nullid))
+            else:
+                clonecodepath = "legacy-pull"
+
+                revs = None
+                if rev:
+                    if not srcpeer.capable("lookup"):
+                        raise error.Abort(
+                            _(
+                                "src repository does not support "
+                                "revision lookup and so doesn't "
+                                "support clone by revision"
+                            )
+                        )
+                    revs = _batchlookup(srcpeer, rev)
+                    checkout = revs[0]
+
+                # Can we use EdenAPI CloneData provided by a separate EdenAPI
+                # client?
+                if (
+                    getattr(destrepo, "nullableedenapi", None)
+                    and destrepo.name
+                    and (
+                        (
+                            ui.configbool("clone", "force-edenapi-clonedata")
+                            or destrepo.ui.configbool(
+                                "clone", "force-edenapi-clonedata"
+                            )
+                        )
+                        or (
+                            (
+                                ui.configbool("clone", "prefer-edenapi-clonedata")
+                                or destrepo.ui.configbool(
+                                    "clone", "prefer-edenapi-clonedata"
+                                )
+                            )
+                            and "segmented-changelog" in destrepo.edenapi.capabilities()
+                        )
+                    )
+                ):
+                    clonecodepath = "segments"
+                    ui.status(_("fetching lazy changelog\n"))
+                    clonemod.segmentsclone(srcpeer.url(), destrepo)
+                # Can we use the new code path (stream clone + shallow + no
+                # update + selective pull)?
+                elif (
+                    destrepo
+                    and not pull
+                    and not update
+                    and not rev
+                    and shallow
+                    and stream is not False
+                    and ui.configbool("remotenames", "selectivepull")
+                ):
+                    if ui.configbool("unsafe", "emergency-clone"):
+                        clonecodepath = "emergency"
+                        clonemod.emergencyclone(srcpeer.url(), destrepo)
+                    else:
+                        clonecodepath = "revlog"
+                        clonemod.revlogclone(srcpeer.url(), destrepo)
+                elif destrepo:
+                    reasons = []
+                    if pull:
+                        reasons.append("pull")
+                    if update:
+                        reasons.append("update")
+                    if rev:
+                        reasons.append("rev")
+                    if not shallow:
+                        reasons.append("not-shallow")
+                    if stream is False:
+                        reasons.append("not-stream")
+                    if not ui.configbool("remotenames", "selectivepull"):
+                        reasons.append("not-selectivepull")
+                    ui.log(
+                        "features",
+                        fullargs=repr(pycompat.sysargv),
+                        feature="legacy-clone",
+                        traceback=util.smarttraceback(),
+                        reason=" ".join(reasons),
+                    )
+                    with destrepo.wlock(), destrepo.lock(), destrepo.transaction(
+                        "clone"
+                    ):
+                        if not stream:
+                            if pull:
+                                stream = False
+                            else:
+                                stream = None
+
+                        overrides = {
+                            # internal config: ui.quietbookmarkmove
+                            ("ui", "quietbookmarkmove"): True,
+                            # the normal pull process each commit and so is more expensive
+                            # than streaming bytes from disk to the wire.
+                            # disabling selectivepull allows to run a streamclone
+                            ("remotenames", "selectivepull"): False,
+                        }
+                        opargs = {}
+                        if shallow:
+                            opargs["extras"] = {"shallow": True}
+                        with destrepo.ui.configoverride(overrides, "clone"):
+                            exchange.pull(
+                                destrepo,
+                                # pyre-fixme[61]: `srcpeer` is undefined, or not always
+                                #  defined.
+                                srcpeer,
+                                revs,
+                                streamclonerequested=stream,
+                                opargs=opargs,
+                            )
+                elif srcrepo:
+                    exchange.push(
+                        srcrepo,
+                        destpeer,
+                        revs=revs,
+                        bookmarks=srcrepo._bookmarks.keys(),
+                    )
+                else:
+                    raise error.Abort(_("clone from remote to remote not supported"))
+
+            # The clone data is on disk; a failure from here on (update,
+            # hooks) must not delete it.
+            cancelcleanup()
+
+            # take wlock/lock/transaction (three lock-file round-trips) only
+            # when there is actually an update to perform
+            if destrepo and update:
+                with destrepo.wlock(), destrepo.lock(), destrepo.transaction("clone"):
+                    if update is not True:
+                        checkout = srcpeer.lookup(update)
+                    uprev = None
+                    status = None
+                    if checkout is not None:
+                        try:
+                            uprev = destrepo.lookup(checkout)
+                        except error.RepoLookupError:
+                            if update is not True:
+                                try:
+                                    uprev = destrepo.lookup(update)
+                                except error.RepoLookupError:
+                                    pass
+                    if uprev is None:
+                        # membership tests instead of exception-driven
+                        # lookups; each candidate here usually misses
+                        bm = destrepo._bookmarks
+                        if "@" in bm:
+                            uprev = bm["@"]
+                            update = "@"
+                            bn = destrepo[uprev].branch()
+                            if bn == "default":
+                                status = _("updating to bookmark @\n")
+                            else:
+                                status = _("updating to bookmark @ on branch %s\n") % bn
+                        elif "default" in destrepo.branchmap():
+                            uprev = destrepo.branchtip("default")
+                        else:
+                            uprev = destrepo.lookup("tip")
+                    if not status:
+                        bn = destrepo[uprev].branch()
+                        status = _("updating to branch %s\n") % bn
+                    destrepo.ui.status(status)
+                    _update(destrepo, uprev)
+                    if update in destrepo._bookmarks:
+                        bookmarks.activate(destrepo, update)
+            clonepreclose(
+                ui,
+                peeropts,
+                source,
+                dest,
+                pull,
+                rev,
+                update,
+                stream,
+                # pyre-fixme[61]: `srcpeer` is undefined, or not always defined.
+                srcpeer,
+                destpeer,
+                clonecodepath=clonecodepath,
+            )
+        finally:
+            _islocalcache.clear()
+            release(srclock, destlockw, destlock)
+            if cachepeer is not None:
+                cachepeer.close()
+            # pyre-fixme[61]: `srcpeer` is undefined, or not always defined.
+            if srcpeer is not None:
+                srcpeer.close()
+            if destpeer is not None:
+                destpeer.close()
+    return destpeer
+
+
+def _writehgrc(repo, abspath, configfiles) -> None:
+    with repo.wlock(), repo.lock():
+        template = _(uimod.samplehgrcs["cloned"])
+        with repo.localvfs(repo.ui.identity.configrepofile(), "wb") as fp:
+            u = _cachedurl(abspath)
+            u.passwd = None
+            defaulturl = str(u)
+            fp.write(pycompat.encodeutf8(util.tonativeeol(template % defaulturl)))
+
+            if configfiles:
+                fp.write(pycompat.encodeutf8(util.tonativeeol("\n")))
+                for file in configfiles:
+                    fp.write(
+                        pycompat.encodeutf8(util.tonativeeol("%%include %s\n" % file))
+                    )
+
+
+def clonepreclose(
+    ui,
+    peeropts,
+    source,
+    dest=None,
+    pull: bool = False,
+    rev=None,
+    update: Union[bool, str] = True,
+    stream: Optional[bool] = False,
+    srcpeer=None,
+    destpeer=None,
+    clonecodepath=None,
+):
+    """Wrapped by extensions like remotenames before closing the peers
+
+    clonecodepath is one of:
+    - "copy": The clone was done by copying local files.
+    - "legacy-pull": The clone was done by the (legacy) pull code path.
+    - "revlog": The clone was done by the clone.streamclone code path,
+      which is less racy and writes remote bookmarks.
+    - "segments": The clone was done by lazy changelog path.
+    - "emergency": The clone was done by the emergency code path.
+    """
+    return srcpeer, destpeer
+
+
+def _showstats(repo, stats: Iterable[object], quietempty: bool = False) -> None:
+    from . import edenfs
+
+    if edenfs.requirement in repo.requirements:
+        return _eden_showstats(repo, stats, quietempty)
+
+    if quietempty and not any(stats):
+        return
+    repo.ui.status(
+        _(
+            "%d files updated, %d files merged, "
+            "%d files removed, %d files unresolved\n"
+        )
+        % stats
+    )
+
+
+def _eden_showstats(repo, stats, quietempty: bool = False) -> None:
+    # We hide the updated and removed counts, because they are not accurate
+    # with eden.  One of the primary goals of eden is that the entire working
+    # directory does not need to be accessed or traversed on update operations.
+    (updated, merged, removed, unresolved) = stats
+    if merged or unresolved:
+        repo.ui.status(
+            _("%d files merged, %d files unresolved\n") % (merged, unresolved)
+        )
+    elif not quietempty:
+        repo.ui.status(_("update complete\n"))
+
+
+def updaterepo(repo, node, overwrite, updatecheck=None):
+    """Update the working directory to node.
+
+    When overwrite is set, changes are clobbered, merged else
+
+    returns stats (see pydoc merge.applyupdates)"""
+    from . import merge as mergemod
+
+    return mergemod.update(
+        repo,
+        node,
+        False,
+        overwrite,
+        labels=["working copy", "destination"],
+        updatecheck=updatecheck,
+    )
+
+
+def update(repo, node, quietempty: bool = False, updatecheck=None):
+    """update the working directory to node
+
+    Returns if any files were unresolved.
+    """
+    stats = updaterepo(repo, node, False, updatecheck=updatecheck)
+    _showstats(repo, stats, quietempty)
+    if stats[3]:
+        repo.ui.status(_("use '@prog@ resolve' to retry unresolved file merges\n"))
+    return stats[3] > 0
+
+
+# naming conflict in clone()
+_update = update
+
+
+def clean(repo, node, show_stats: bool = True, quietempty: bool = False):
+    """forcibly switch the working directory to node, clobbering changes
+
+    Returns if any files were unresolved.
+    """
+    stats = updaterepo(repo, node, True)
+    repo.localvfs.unlinkpath("graftstate", ignoremissing=True)
+    if show_stats:
+        _showstats(repo, stats, quietempty)
+    return stats[3] > 0
+
+
+# naming conflict in updatetotally()
+_clean = clean
+
+
+def updatetotally(
+    ui, repo, checkout, brev, clean: bool = False, updatecheck: Optional[str] = None
+):
+    """Update the working directory with extra care for non-file components
+
+    This takes care of non-file components below:
+
+    :bookmark: might be advanced or (in)activated
+
+    This takes arguments below:
+
+    :checkout: to which revision the working directory is updated
+    :brev: a name, which might be a bookmark to be activated after updating
+    :clean: whether changes in the working directory can be discarded
+    :updatecheck: how to deal with a dirty working directory
+
+    Valid values for updatecheck are (None => linear):
+
+     * abort: abort if the working directory is dirty
+     * none: don't check (merge working directory changes into destination)
+     * linear: check that update is linear before merging working directory
+               changes into destination
+     * noconflict: check that the update does not result in file merges
+
+    This returns whether conflict is detected at updating or not.
+    """
+    from . import cmdutil, destutil
+
+    if updatecheck is None:
+        updatecheck = ui.config("commands", "update.check")
+        if updatecheck not in ("abort", "none", "linear", "noconflict"):
+            # If not configured, or invalid value configured
+            updatecheck = "linear"
+    with repo.wlock():
+        movemarkfrom = None
+        warndest = False
+        if checkout is None:
+            updata = destutil.destupdate(repo, clean=clean)
+            checkout, movemarkfrom, brev = updata
+            warndest = True
+
+        if clean:
+            hasunresolved = _clean(repo, checkout)
+        else:
+            if updatecheck == "abort":
+                cmdutil.bailifchanged(repo, merge=False)
+                updatecheck = "none"
+            hasunresolved = _update(repo, checkout, updatecheck=updatecheck)
+        if not hasunresolved and movemarkfrom:
+            if movemarkfrom == repo["."].node():
+                pass  # no-op update
+            elif bookmarks.update(repo, [movemarkfrom], repo["."].node()):
+                b = ui.label(repo._activebookmark, "bookmarks.active")
+                ui.status(_("updating bookmark %s\n") % b)
+            else:
+                # this can happen with a non-linear update
+                b = ui.label(repo._activebookmark, "bookmarks")
+                ui.status(_("(leaving bookmark %s)\n") % b)
+                bookmarks.deactivate(repo)
+        elif brev in repo._bookmarks:
+            if brev != repo._activebookmark:
+                b = ui.label(brev, "bookmarks.active")
+                ui.status(_("(activating bookmark %s)\n") % b)
+            bookmarks.activate(repo, brev)
+        else:
+            if repo._activebookmark:
+                b = ui.label(repo._activebookmark, "bookmarks")
+                ui.status(_("(leaving bookmark %s)\n") % b)
+            bookmarks.deactivate(repo)
+
+        if warndest:
+            destutil.statusotherdests(ui, repo)
+
+    return hasunresolved
+
+
+def merge(
+    repo, node, force=None, remind: bool = True, mergeforce: bool = False, labels=None
+):
+    """Branch merge with node, resolving changes. Return true if any
+    unresolved conflicts."""
+    from . import merge as mergemod
+
+    stats = mergemod.update(
+        repo, node, True, force, mergeforce=mergeforce, labels=labels
+    )
+    _showstats(repo, stats)
+    if stats[3]:
+        repo.ui.status(
+            _(
+                "use '@prog@ resolve' to retry unresolved file merges "
+                "or '@prog@ goto -C .' to abandon\n"
+            )
+        )
+    elif remind:
+        repo.ui.status(_("(branch merge, don't forget to commit)\n"))
+    return stats[3] > 0
+
+
+# local settings copied to the remote ui on every peer creation; hoisted to
+# module scope so remoteui does not rebuild the tuple per call
+_remoteuisections = (
+    "auth",
+    "auth_proxy",
+    "cats",
+    "hostfingerprints",
+    "hostsecurity",
+    "http_proxy",
+    "help",
+    "edenapi",
+    "infinitepush",
+    "lfs",
+    "mononokepeer",
+)
+
+
+def remoteui(src, opts):
+    "build a remote ui from ui or repo and opts"
+
+    if util.safehasattr(src, "ui"):  # looks like a repository
+        # drop repo-specific config
+        dst = src.ui.copywithoutrepo()
+        # to copy target options from repo
+        src = src.ui
+    else:
+        # assume it's a global ui object
+        dst = src.copy()
+
+    # copy ssh-specific options
+    for o in "ssh", "remotecmd":
+        v = opts.get(o) or src.config("ui", o)
+        if v:
+            dst.setconfig("ui", o, v, "copied")
+
+    # copy bundle-specific options
+    r = src.config("bundle", "mainreporoot")
+    if r:
+        dst.setconfig("bundle", "mainreporoot", r, "copied")
+
+    # copy selected local settings to the remote ui in one bulk pass
+    items = [
+        (sect, key, val)
+        for sect in _remoteuisections
+        for key, val in src.configitems(sect)
+    ]
+    if items:
+        dst.setconfigs(items, "copied")
+    v = src.config("web", "cacerts")
+    if v:
+        dst.setconfig("web", "cacerts", util.expandpath(v), "copied")
+
+    return dst
+
+
+# Files of interest
+# Used to check if the repository has changed looking at mtime and size of
+# these files.
+foi = (
+    ("spath", "00changelog.i"),
+    ("spath", "phaseroots"),  # ! phase can change content at the same size
+    ("path", "bookmarks"),  # ! bookmark can change content at the same size
+)
+
+# Precompiled accessors for the files of interest; operator.attrgetter
+# avoids re-resolving the attribute name string on every refresh.
+_foigetters = tuple((operator.attrgetter(attr), fname) for attr, fname in foi)
+
+# One C-level call extracting the stat fields _repostate compares.
+# st_mtime_ns is attribute-only (no tuple index), so attrgetter rather
+# than itemgetter.
+_foistatfields = operator.attrgetter("st_mtime_ns", "st_size", "st_ino")
+
+
+class cachedlocalrepo(object):
+    """Holds a localrepository that can be cached and reused."""
+
+    # Long-running hosts hold many of these; slots keep the per-instance
+    # footprint down and make the hot _state/_lastcheck reads in fetch()
+    # plain slot loads instead of dict lookups.
+    __slots__ = ("_repo", "_state", "mtime", "_ttl", "_lastcheck", "_foipaths")
+
+    def __init__(self, repo):
+        """Create a new cached repo from an existing repo.
+
+        We assume the passed in repo was recently created. If the
+        repo has changed between when it was created and when it was
+        turned into a cache, it may not refresh properly.
+        """
+        assert isinstance(repo, localrepo.localrepository)
+        self._repo = repo
+        self._updatefoipaths()
+        self._state, self.mtime = self._repostate()
+        self._ttl = repo.ui.configint("cache", "repo-state-ttl-ms") / 1000.0
+        self._lastcheck = time.monotonic()
+
+    def _updatefoipaths(self) -> None:
+        # resolve the files of interest against the current repo instance
+        # once; the attribute access on the repo is per-fetch overhead
+        # otherwise
+        self._foipaths = tuple(
+            (getter(self._repo), fname) for getter, fname in _foigetters
+        )
+
+    def invalidate(self) -> None:
+        """Force the next fetch() to re-examine the repository state.
+
+        For callers that just mutated the repository and cannot wait out
+        the TTL window.
+        """
+        self._lastcheck = float("-inf")
+
+    def fetch(self):
+        """Refresh (if necessary) and return a repository.
+
+        If the cached instance is out of date, it will be recreated
+        automatically and returned.
+
+        Returns a tuple of the repo and a boolean indicating whether a new
+        repo instance was created.
+        """
+        # Within the TTL window, trust the previous check and skip the stat
+        # calls entirely; hot callers can invoke this many times per second.
+        now = time.monotonic()
+        if now - self._lastcheck < self._ttl:
+            return self._repo, False
+
+        # We compare the mtimes and sizes of some well-known files to
+        # determine if the repo changed. This is not precise, as mtimes
+        # are susceptible to clock skew and imprecise filesystems and
+        # file content can change while maintaining the same size.
+
+        state, mtime = self._repostate()
+        # Do not slide the TTL window while the newest mtime is within the
+        # current second: the timestamp cannot distinguish further writes
+        # landing in the same second, so keep re-checking until the clock
+        # has ticked past it.
+        if time.time() - mtime >= 1:
+            self._lastcheck = now
+        if state == self._state:
+            return self._repo, False
+
+        repo = repository(self._repo.baseui, self._repo.url())
+        self._repo = repo
+        self._updatefoipaths()
+        self._state = state
+        self.mtime = mtime
+
+        return self._repo, True
+
+    def _repostate(self):
+        # Read each distinct directory once with scandir instead of statting
+        # every file of interest separately; the directory read prefetches
+        # the entry stat on most platforms, so the common case costs one
+        # syscall sequence per prefix rather than one stat per file.
+        byprefix = {}
+        for prefix, fname in self._foipaths:
+            byprefix.setdefault(prefix, []).append(fname)
+
+        stats = {}
+        for prefix, fnames in byprefix.items():
+            wanted = set(fnames)
+            try:
+                with os.scandir(prefix) as entries:
+                    for entry in entries:
+                        if entry.name in wanted:
+                            try:
+                                stats[(prefix, entry.name)] = entry.stat()
+                            except OSError:
+                                continue
+            except OSError:
+                pass
+            prefixst = None
+            for fname in fnames:
+                if (prefix, fname) not in stats:
+                    # missing file: fall back to the directory itself, shared
+                    # by every absent entry of this prefix. Plain os.stat -
+                    # the mtimes get truncated below, so the integer-mtime
+                    # wrapper util.stat adds is pure overhead here.
+                    if prefixst is None:
+                        prefixst = os.stat(prefix)
+                    stats[(prefix, fname)] = prefixst
+
+        # nanosecond mtime catches sub-second rewrites and the inode
+        # catches atomictemp-style rename-in-place, both of which the
+        # old (seconds, size) pair could miss
+        state = tuple(_foistatfields(stats[key]) for key in self._foipaths)
+        maxmtime = max(s[0] for s in state) // 1000000000
+
+        return state, maxmtime
+
+    def copy(self):
+        """Obtain a copy of this class instance.
+
+        A new localrepository instance is obtained. The new instance should be
+        completely independent of the original.
+        """
+        repo = repository(self._repo.baseui, self._repo.origroot)
+        # Snapshot the cached fields instead of going through __init__,
+        # which would re-stat the files of interest only for the result to
+        # be overwritten with our state anyway.
+        c = cachedlocalrepo.__new__(cachedlocalrepo)
+        c._repo = repo
+        c._updatefoipaths()
+        c._state = self._state
+        c.mtime = self.mtime
+        c._ttl = self._ttl
+        c._lastcheck = self._lastcheck
+        return c
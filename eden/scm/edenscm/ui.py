@@ -178,6 +178,10 @@ class ui(object):
         self._colormode = None
         self._styler = None
         self._styles = {}
+        # label -> resolved style string, maintained by color.colorlabel.
+        # Deliberately not copied from src: it must be rebuilt whenever
+        # _styles changes.
+        self._stylecache = {}
         # Whether the output stream is known to be a terminal.
         self._terminaloutput = None
         # The current command name being executed.
@@ -373,6 +377,9 @@ class ui(object):
     def setconfig(self, section, name, value, source=""):
         return self._uiconfig.setconfig(section, name, value, source)
 
+    def setconfigs(self, items, source=""):
+        return self._uiconfig.setconfigs(items, source)
+
     def configtostring(self):
         return self._uiconfig.configtostring()
 
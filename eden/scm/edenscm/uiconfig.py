@@ -150,9 +150,9 @@ class uiconfig(object):
             self.tracebackflag = self.configbool("ui", "traceback")
             self.logmeasuredtimes = self.configbool("ui", "logmeasuredtimes")
 
-    def setconfig(self, section, name, value, source=""):
+    def _serializevalue(self, value):
         if isinstance(value, (str, int, float, bool)):
-            value = str(value)
+            return str(value)
         elif util.safehasattr(value, "__iter__"):
 
             def escape(v):
@@ -160,9 +160,9 @@ class uiconfig(object):
                     v = v.replace('"', '\\"')
                 return '"%s"' % v
 
-            value = ",".join(escape(v) for v in value)
+            return ",".join(escape(v) for v in value)
         elif value is None:
-            pass
+            return value
         else:
             # XXX Sad - Some code depends on setconfig a Python object.
             # That cannot be represented in the Rust config object. So
@@ -170,12 +170,32 @@ class uiconfig(object):
             # TODO remove those users and make this a ProgrammingError.
             replacement = "@%x" % id(value)
             self._unserializable[replacement] = value
-            value = replacement
+            return replacement
 
+    def setconfig(self, section, name, value, source=""):
+        value = self._serializevalue(value)
         self._pinnedconfigs.add((section, name))
         self._rcfg.set(section, name, value, source or "ui.setconfig")
         self.fixconfig(section=section)
 
+    def setconfigs(self, items, source=""):
+        """set many (section, name, value) configs at once
+
+        Bulk version of setconfig: values get the same normalization, but
+        fixconfig runs once per affected section instead of once per key.
+        """
+        rcfg = self._rcfg
+        pinned = self._pinnedconfigs
+        source = source or "ui.setconfig"
+        sections = set()
+        for section, name, value in items:
+            value = self._serializevalue(value)
+            pinned.add((section, name))
+            rcfg.set(section, name, value, source)
+            sections.add(section)
+        for section in sections:
+            self.fixconfig(section=section)
+
     def configtostring(self):
         return self._rcfg.tostring()
 
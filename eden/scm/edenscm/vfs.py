@@ -142,6 +142,33 @@ class abstractvfs(pycompat.ABC):
         with self(path, mode=mode, notindexed=notindexed) as fp:
             return fp.writelines(data)
 
+    def batchwrite(
+        self, items: "Iterable[Tuple[str, bytes]]", fsyncdir: bool = True
+    ) -> None:
+        """write several small files, then fsync the directories once
+
+        The individual writes are not fsynced; a single directory-level
+        fsync at the end makes the whole batch durable in one metadata
+        flush instead of one per file. On platforms where a directory
+        cannot be opened for fsync this degrades to plain writes.
+        """
+        dirs = set()
+        for path, data in items:
+            self.write(path, data)
+            dirs.add(os.path.dirname(self.join(path)))
+        if fsyncdir:
+            for d in dirs:
+                try:
+                    fd = os.open(d, os.O_RDONLY)
+                except OSError:
+                    continue
+                try:
+                    os.fsync(fd)
+                except OSError:
+                    pass
+                finally:
+                    os.close(fd)
+
     def append(self, path: str, data: bytes) -> int:
         with self(path, "ab") as fp:
             return fp.write(data)
@@ -0,0 +1,33 @@
+#chg-compatible
+#debugruntest-compatible
+
+  $ hg init repo
+  $ cd repo
+  $ echo a > a
+  $ hg -q commit -A -m one
+
+  $ cat <<EOF > check_cache.py
+  > from edenscm import commands, hg
+  > c = hg.cachedlocalrepo(repo)
+  > # within the TTL window fetch() serves the cached instance without
+  > # re-examining the repository
+  > r1, created1 = c.fetch()
+  > r2, created2 = c.fetch()
+  > ui.write("cached: %s %s %s\n" % (created1, created2, r1 is r2))
+  > # grow the repo; invalidate() forces the next fetch() past the TTL
+  > # window and the state change yields a fresh instance
+  > open("b", "w").write("b")
+  > commands.add(ui, r1, "b")
+  > commands.commit(ui, r1, message="two")
+  > c.invalidate()
+  > r3, created3 = c.fetch()
+  > ui.write("refreshed: %s %s\n" % (created3, len(r3)))
+  > # copy() hands out an independent repo instance carrying the same state
+  > c2 = c.copy()
+  > r4, created4 = c2.fetch()
+  > ui.write("copied: %s %s\n" % (r4 is r3, created4))
+  > EOF
+  $ hg debugshell ./check_cache.py
+  cached: False False True
+  refreshed: True 2
+  copied: False False
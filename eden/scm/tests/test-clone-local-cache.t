@@ -0,0 +1,67 @@
+#chg-compatible
+#debugruntest-compatible
+#inprocess-hg-incompatible
+
+  $ configure dummyssh
+  $ setconfig clone.local-cache=true clone.local-cache-path=$TESTTMP/clone-cache
+
+Prepare a repo to clone over the wire:
+
+  $ hg init server
+  $ cd server
+  $ echo a > a
+  $ hg -q commit -A -m one
+  $ cd ..
+
+The first clone populates the cache with one bare clone of the source:
+
+  $ hg clone -q -U ssh://user@dummy/server clone1
+  $ hg -R clone1 log -T '{desc}\n'
+  one
+  $ ls $TESTTMP/clone-cache | wc -l
+  1
+
+A reclone reuses the cache entry, refreshing it with an incremental pull:
+
+  $ cd server
+  $ echo b > b
+  $ hg -q commit -A -m two
+  $ cd ..
+  $ hg clone -q -U ssh://user@dummy/server clone2
+  $ hg -R clone2 log -T '{desc}\n'
+  two
+  one
+  $ ls $TESTTMP/clone-cache | wc -l
+  1
+
+The destination keeps pointing at the real source, not the cache:
+
+  $ grep '^default' clone2/.hg/hgrc
+  default = ssh://user@dummy/server
+
+An unusable cache location warns and falls back to a regular clone:
+
+  $ touch $TESTTMP/not-a-dir
+  $ hg clone -q -U --config clone.local-cache-path=$TESTTMP/not-a-dir/x ssh://user@dummy/server clone3
+  warning: not using clone cache (*) (glob)
+  $ hg -R clone3 log -T '{desc}\n'
+  two
+  one
+
+The cache combines with the parallel source handshake:
+
+  $ hg clone -q -U --config clone.parallel-peer-setup=true ssh://user@dummy/server clone4
+  $ hg -R clone4 log -T '{desc}\n'
+  two
+  one
+
+A cache-backed clone must hand the real source peer to post-clone
+processing: with remotenames and selectivepull the server bookmark has
+to end up as a remote bookmark in the fresh clone.
+
+  $ hg bookmark -R server -r tip master
+  $ hg clone -q -U --config extensions.remotenames= --config remotenames.selectivepull=True --config remotenames.selectivepulldefault=master ssh://user@dummy/server clone5
+  $ hg -R clone5 --config extensions.remotenames= bookmarks --remote
+     default/master            * (glob)
+  $ hg -R clone5 --config extensions.remotenames= log -r default/master -T '{desc}\n'
+  two
@@ -0,0 +1,45 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This software may be used and distributed according to the terms of the
+# GNU General Public License version 2.
+
+import unittest
+
+import silenttestrunner
+from edenscm import ui as uimod
+
+
+class testsetconfigs(unittest.TestCase):
+    def setUp(self):
+        self.ui = uimod.ui()
+
+    def testsetmany(self):
+        self.ui.setconfigs(
+            [("foo", "a", "1"), ("foo", "b", "2"), ("bar", "c", "3")], "test"
+        )
+        self.assertEqual(self.ui.config("foo", "a"), "1")
+        self.assertEqual(self.ui.config("foo", "b"), "2")
+        self.assertEqual(self.ui.config("bar", "c"), "3")
+
+    def testvaluenormalization(self):
+        # values take the same serialization as setconfig
+        self.ui.setconfigs(
+            [("foo", "bool", True), ("foo", "int", 42), ("foo", "list", ["x", "y"])],
+            "test",
+        )
+        self.assertTrue(self.ui.configbool("foo", "bool"))
+        self.assertEqual(self.ui.configint("foo", "int"), 42)
+        self.assertEqual(self.ui.configlist("foo", "list"), ["x", "y"])
+
+    def testmatchessetconfig(self):
+        self.ui.setconfigs([("foo", "a", "1")], "test")
+        other = uimod.ui()
+        other.setconfig("foo", "a", "1", "test")
+        self.assertEqual(
+            self.ui.config("foo", "a"),
+            other.config("foo", "a"),
+        )
+
+
+if __name__ == "__main__":
+    silenttestrunner.main(__name__)
@@ -0,0 +1,38 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This software may be used and distributed according to the terms of the
+# GNU General Public License version 2.
+
+import os
+import tempfile
+import unittest
+
+import silenttestrunner
+from edenscm import vfs
+
+
+class testbatchwrite(unittest.TestCase):
+    def setUp(self):
+        self.vfs = vfs.vfs(tempfile.mkdtemp(dir=os.getcwd()), audit=False)
+
+    def testwritesallfiles(self):
+        self.vfs.batchwrite([("a", b"one"), ("dir/b", b"two")])
+        self.assertEqual(self.vfs.read("a"), b"one")
+        self.assertEqual(self.vfs.read("dir/b"), b"two")
+
+    def testoverwrite(self):
+        self.vfs.write("a", b"old")
+        self.vfs.batchwrite([("a", b"new")])
+        self.assertEqual(self.vfs.read("a"), b"new")
+
+    def testnofsync(self):
+        self.vfs.batchwrite([("a", b"one")], fsyncdir=False)
+        self.assertEqual(self.vfs.read("a"), b"one")
+
+    def testempty(self):
+        self.vfs.batchwrite([])
+        self.assertEqual(self.vfs.listdir(), [])
+
+
+if __name__ == "__main__":
+    silenttestrunner.main(__name__)